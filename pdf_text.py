@@ -0,0 +1,74 @@
+"""PDF text extraction, split across worker processes for large documents.
+
+Kept out of streamlit_app.py because Streamlit runs the app script as a
+synthetic __main__ that worker processes cannot import functions from.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+try:
+    # PDFium extracts text in native code, far faster than PyPDF2
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+    import PyPDF2
+
+MAX_WORKERS = 4
+# Below this many pages per worker, process startup costs more than it saves
+MIN_PAGES_PER_WORKER = 8
+
+
+def count_pages(pdf_path):
+    """Number of pages in a PDF"""
+    if pdfium:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    with open(pdf_path, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_pages(pdf_path, start, stop):
+    """Extract the texts of pages [start, stop) of a PDF"""
+    # Document handles don't pickle, so each worker opens the file itself
+    if pdfium:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return [
+                pdf[i].get_textpage().get_text_range() for i in range(start, stop)
+            ]
+        finally:
+            pdf.close()
+    with open(pdf_path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def extract_page_texts(pdf_path):
+    """Extract the text of each page in a PDF, in page order"""
+    num_pages = count_pages(pdf_path)
+
+    num_workers = min(
+        os.cpu_count() or 1, MAX_WORKERS, num_pages // MIN_PAGES_PER_WORKER
+    )
+    if num_workers <= 1:
+        return extract_pages(pdf_path, 0, num_pages)
+
+    # Contiguous page ranges, one per worker; map() keeps them in order
+    step = -(-num_pages // num_workers)
+    starts = range(0, num_pages, step)
+    stops = [min(start + step, num_pages) for start in starts]
+    with ProcessPoolExecutor(num_workers) as pool:
+        return list(
+            chain.from_iterable(
+                pool.map(extract_pages, [pdf_path] * len(starts), starts, stops)
+            )
+        )
+
+
+def extract_text(pdf_path):
+    """Extract the text of every page in a PDF as one string"""
+    return "\n".join(extract_page_texts(pdf_path))
@@ -1,9 +1,19 @@
 import streamlit as st
 import pandas as pd
-import snowflake.connector
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
+from collections import OrderedDict, deque
 from datetime import datetime
-import PyPDF2
+import functools
+import hashlib
+import hmac
+from itertools import islice
+import json
 import os
+import tempfile
+import threading
+import time
+import uuid
 
 # Page configuration
 st.set_page_config(
@@ -44,29 +54,90 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Option lists shared by the event and registration forms
+DISCIPLINES = (
+    "Alpine",
+    "Combined Alpine",
+    "Downhill",
+    "Giant Slalom",
+    "Slalom",
+    "Super G",
+)
+DISCIPLINE_FILTER_OPTIONS = ("All",) + DISCIPLINES
+DIVISIONS = (
+    "Alaska",
+    "Central",
+    "Eastern",
+    "Far West",
+    "Foreign",
+    "Intermountain",
+    "Northern",
+    "Pacific Northwest",
+    "Rocky",
+)
+
+# Chat history kept in the session, and the most recent part of it that is rendered
+CHAT_HISTORY_LIMIT = 200
+CHAT_DISPLAY_LIMIT = 50
+
+# Most events fetched for one listing; narrower searches reach the rest
+EVENT_LIST_LIMIT = 200
+
 # Initialize session state variables
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
 if "user_email" not in st.session_state:
     st.session_state.user_email = None
+if "user_profile" not in st.session_state:
+    st.session_state.user_profile = None
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "message_submitted" not in st.session_state:
-    st.session_state.message_submitted = False
+    st.session_state.chat_history = deque(maxlen=CHAT_HISTORY_LIMIT)
+
+password_hasher = PasswordHasher()
 
 # Snowflake connection setup
 @st.cache_resource
-def create_connection():
-    return snowflake.connector.connect(
-        user=st.secrets["SNOWFLAKE_USERNAME"],
-        password=st.secrets["SNOWFLAKE_PASSWORD"],
-        account=st.secrets["SNOWFLAKE_ACCOUNT"],
-        role=st.secrets["SNOWFLAKE_ROLE"],
-        warehouse=st.secrets["SNOWFLAKE_WAREHOUSE"],
-        database=st.secrets["SNOWFLAKE_DATABASE"],
-        schema=st.secrets["SNOWFLAKE_SCHEMA"],
+def create_connection_pool():
+    """Build a process-wide pool of Snowflake connections"""
+    # Imported here so the driver only loads when a pool is first built
+    from snowflake.sqlalchemy import URL
+    from sqlalchemy import create_engine
+
+    return create_engine(
+        URL(
+            user=st.secrets["SNOWFLAKE_USERNAME"],
+            password=st.secrets["SNOWFLAKE_PASSWORD"],
+            account=st.secrets["SNOWFLAKE_ACCOUNT"],
+            role=st.secrets["SNOWFLAKE_ROLE"],
+            warehouse=st.secrets["SNOWFLAKE_WAREHOUSE"],
+            database=st.secrets["SNOWFLAKE_DATABASE"],
+            schema=st.secrets["SNOWFLAKE_SCHEMA"],
+        ),
+        connect_args={"client_session_keep_alive": True},
+        pool_size=5,
+        max_overflow=10,
+        pool_recycle=-1,
+        pool_timeout=120,
     )
 
+@st.cache_resource
+def create_cortex_session():
+    """Build a Snowpark session for streaming Cortex completions"""
+    # Imported here so Snowpark only loads when chat first streams
+    from snowflake.snowpark import Session
+
+    return Session.builder.configs(
+        {
+            "user": st.secrets["SNOWFLAKE_USERNAME"],
+            "password": st.secrets["SNOWFLAKE_PASSWORD"],
+            "account": st.secrets["SNOWFLAKE_ACCOUNT"],
+            "role": st.secrets["SNOWFLAKE_ROLE"],
+            "warehouse": st.secrets["SNOWFLAKE_WAREHOUSE"],
+            "database": st.secrets["SNOWFLAKE_DATABASE"],
+            "schema": st.secrets["SNOWFLAKE_SCHEMA"],
+        }
+    ).create()
+
 def setup_cortex_functions(conn):
     """Setup Cortex Search and Mistral chat function"""
     try:
@@ -107,16 +178,33 @@ def create_vector_search_table(conn):
     """Create table for storing document embeddings for vector search"""
     try:
         with conn.cursor() as cur:
-            # Create table for document embeddings
+            # Create table for document embeddings; the full text lives once
+            # in PDF_DOCUMENTS, joined on FILENAME
             cur.execute("""
             CREATE TABLE IF NOT EXISTS DOCUMENT_EMBEDDINGS (
                 DOC_ID INTEGER IDENTITY(1,1) PRIMARY KEY,
                 FILENAME VARCHAR NOT NULL,
-                CONTENT TEXT,
                 CONTENT_CHUNK TEXT,
-                EMBEDDING VECTOR,
+                EMBEDDING VECTOR(FLOAT, 768),
+                CENTROID_ID INTEGER,
                 TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
             )
+            CLUSTER BY (CENTROID_ID)
+            """)
+            # Bring tables created by earlier versions up to date
+            cur.execute("ALTER TABLE DOCUMENT_EMBEDDINGS DROP COLUMN IF EXISTS CONTENT")
+            cur.execute(
+                "ALTER TABLE DOCUMENT_EMBEDDINGS ADD COLUMN IF NOT EXISTS CENTROID_ID INTEGER"
+            )
+            cur.execute("ALTER TABLE DOCUMENT_EMBEDDINGS CLUSTER BY (CENTROID_ID)")
+
+            # Coarse centroids that bucket chunks so searches probe a few
+            # clustered partitions instead of scanning every embedding
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS EMBEDDING_CENTROIDS (
+                CENTROID_ID INTEGER PRIMARY KEY,
+                CENTROID VECTOR(FLOAT, 768)
+            )
             """)
             conn.commit()
             return True
@@ -124,69 +212,149 @@ def create_vector_search_table(conn):
         st.error(f"Error creating vector search table: {str(e)}")
         return False
     
+# Cortex embedding call matching the VECTOR(FLOAT, 768) column
+EMBED_SQL = "SNOWFLAKE.CORTEX.EMBED_TEXT_768('e5-base-v2', {})"
+
+# Number of coarse buckets for chunk embeddings, and how many are searched per query
+EMBEDDING_CENTROID_COUNT = 16
+EMBEDDING_PROBE_COUNT = 2
+
+ASSIGN_CENTROIDS_SQL = """
+            UPDATE DOCUMENT_EMBEDDINGS de
+            SET CENTROID_ID = nearest.CENTROID_ID
+            FROM (
+                SELECT
+                    e.DOC_ID,
+                    MIN_BY(c.CENTROID_ID, VECTOR_L2_DISTANCE(e.EMBEDDING, c.CENTROID)) AS CENTROID_ID
+                FROM DOCUMENT_EMBEDDINGS e
+                CROSS JOIN EMBEDDING_CENTROIDS c
+                WHERE {where}
+                GROUP BY e.DOC_ID
+            ) nearest
+            WHERE de.DOC_ID = nearest.DOC_ID
+            """
+
+def build_embedding_centroids(conn, num_centroids=EMBEDDING_CENTROID_COUNT):
+    """Pick coarse centroids from the stored chunks and bucket every chunk"""
+    try:
+        with conn.cursor() as cur:
+            # Sampled chunk embeddings serve as the centroids
+            cur.execute(
+                """
+            INSERT OVERWRITE INTO EMBEDDING_CENTROIDS (CENTROID_ID, CENTROID)
+            SELECT ROW_NUMBER() OVER (ORDER BY DOC_ID), EMBEDDING
+            FROM DOCUMENT_EMBEDDINGS SAMPLE (%s ROWS)
+            """,
+                (num_centroids,),
+            )
+            cur.execute(ASSIGN_CENTROIDS_SQL.format(where="1=1"))
+        conn.commit()
+        search_chunks.clear()
+        return True
+    except Exception as e:
+        st.error(f"Error building embedding centroids: {str(e)}")
+        return False
+
+# Chunk boundaries to split on, coarsest first
+CHUNK_SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+def split_on_boundaries(text, max_chars, separators):
+    """Break text into pieces of at most max_chars on the coarsest separator that fits"""
+    if len(text) <= max_chars:
+        return [text]
+    if not separators:
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+    sep, finer = separators[0], separators[1:]
+    parts = text.split(sep)
+    pieces = []
+    for i, part in enumerate(parts):
+        # Keep the separator with the text before it
+        if i < len(parts) - 1:
+            part += sep
+        pieces.extend(split_on_boundaries(part, max_chars, finer))
+    return pieces
+
+def split_text(text, max_chars=1000, overlap=100, separators=CHUNK_SEPARATORS):
+    """Pack boundary-aligned pieces into chunks, repeating a little context between them"""
+    chunks = []
+    current = ""
+    for piece in split_on_boundaries(text, max_chars, separators):
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap else ""
+            current = tail if len(tail) + len(piece) <= max_chars else ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
 def process_pdf_with_embeddings(conn, pdf_path, chunk_size=1000):
     """Process PDF and create embeddings for vector search"""
     try:
-        with open(pdf_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            full_text = ""
+        full_text = extract_pdf_text(pdf_path)
+
+        if not full_text.strip():
+            st.error(f"No text extracted from {pdf_path}")
+            return False
             
-            # Extract text from all pages
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n"
+        # Split content on paragraph and sentence boundaries and create embeddings
+        chunks = split_text(full_text, max_chars=chunk_size)
+        filename = os.path.basename(pdf_path)
+        
+        with conn.cursor() as cur:
+            # Remove existing entries
+            cur.execute("DELETE FROM DOCUMENT_EMBEDDINGS WHERE FILENAME = %s", (filename,))
             
-            if not full_text.strip():
-                st.error(f"No text extracted from {pdf_path}")
-                return False
-                
-            # Split content into chunks and create embeddings
-            chunks = [full_text[i:i + chunk_size] for i in range(0, len(full_text), chunk_size)]
-            filename = os.path.basename(pdf_path)
+            # Insert every chunk and its embedding in one statement
+            cur.execute(
+                f"""
+            INSERT INTO DOCUMENT_EMBEDDINGS (FILENAME, CONTENT_CHUNK, EMBEDDING)
+            SELECT %s, c.VALUE::STRING, {EMBED_SQL.format("c.VALUE::STRING")}
+            FROM TABLE(FLATTEN(INPUT => PARSE_JSON(%s))) c
+            """,
+                (filename, json.dumps(chunks)),
+            )
+
+            # Bucket the new chunks under the existing centroids, if any
+            cur.execute(
+                ASSIGN_CENTROIDS_SQL.format(where="e.FILENAME = %s"), (filename,)
+            )
             
-            with conn.cursor() as cur:
-                # Remove existing entries
-                cur.execute("DELETE FROM DOCUMENT_EMBEDDINGS WHERE FILENAME = %s", (filename,))
-                
-                # Insert chunks with embeddings
-                for chunk in chunks:
-                    cur.execute(
-                        "INSERT INTO DOCUMENT_EMBEDDINGS (FILENAME, CONTENT, CONTENT_CHUNK, EMBEDDING) "
-                        "SELECT %s, %s, %s, CORTEX_EMBED(%s)",
-                        (filename, full_text, chunk, chunk)
-                    )
-                
-            conn.commit()
-            st.success(f"Processed and embedded PDF: {filename}")
-            return True
+        conn.commit()
+        search_chunks.clear()
+        st.success(f"Processed and embedded PDF: {filename}")
+        return True
             
     except Exception as e:
         st.error(f"Error processing PDF with embeddings: {str(e)}")
         return False
 
+@st.cache_resource(show_spinner=False)
+def check_mistral_chat(_conn):
+    """Call MISTRAL_CHAT once per process; failures raise so they are retried"""
+    with _conn.cursor() as cur:
+        # Test the function with all required parameters
+        cur.execute("""
+        SELECT MISTRAL_CHAT(
+            CAST('Hello' AS VARCHAR(16777216)),
+            CAST('You are a helpful assistant.' AS VARCHAR(16777216)),
+            0.7,
+            100
+        )
+        """)
+        result = cur.fetchone()
+
+    if not (result and result[0]):
+        raise RuntimeError("Chat system initialization failed - no response from Mistral")
+    return True
+
 def initialize_cortex_system(conn):
     """Initialize the Cortex system with comprehensive error handling"""
     try:
-        # Test if Mistral chat is available
-        with conn.cursor() as cur:
-            # Test the function with all required parameters
-            cur.execute("""
-            SELECT MISTRAL_CHAT(
-                CAST('Hello' AS VARCHAR(16777216)),
-                CAST('You are a helpful assistant.' AS VARCHAR(16777216)),
-                0.7,
-                100
-            )
-            """)
-            
-            result = cur.fetchone()
-            if result and result[0]:
-                st.toast("Chat system initialized successfully", icon='🤖')
-                return True
-            else:
-                st.error("Chat system initialization failed - no response from Mistral", icon='❌')
-                return False
+        # Test if Mistral chat is available; only the first success hits Cortex
+        check_mistral_chat(conn)
+        st.toast("Chat system initialized successfully", icon='🤖')
+        return True
                 
     except Exception as e:
         st.error(f"Error initializing chat system: {str(e)}")
@@ -243,6 +411,18 @@ def create_registration_table(conn):
             """
             )
 
+            # Let substring searches on events prune micro-partitions.
+            # Search optimization needs Enterprise edition, so it is optional.
+            try:
+                cur.execute(
+                    """
+                ALTER TABLE UPCOMING_EVENTS
+                ADD SEARCH OPTIMIZATION ON SUBSTRING(EVENT_NAME, CITY, VENUE)
+                """
+                )
+            except Exception as e:
+                print(f"Search optimization unavailable: {str(e)}")
+
             # Create EVENT_REGISTRATIONS table
             cur.execute(
                 """
@@ -274,12 +454,28 @@ def create_registration_table(conn):
             """
             )
 
+            # Snowflake has no secondary indexes; clustering on the columns
+            # the hot lookups filter by lets it prune micro-partitions
+            for table, key in (
+                ("REGISTRATIONS", "EMAIL"),
+                ("UPCOMING_EVENTS", "EVENT_DATE"),
+                ("EVENT_REGISTRATIONS", "EVENT_ID, USER_ID"),
+            ):
+                cur.execute(f"ALTER TABLE {table} CLUSTER BY ({key})")
+
             conn.commit()
             return True
     except Exception as e:
         st.error(f"Error creating tables: {str(e)}")
         return False
 
+@st.cache_resource(show_spinner=False)
+def bootstrap_schema(_conn):
+    """Run the app's CREATE IF NOT EXISTS DDL once per process; failures raise so they are retried"""
+    if not (create_registration_table(_conn) and create_vector_search_table(_conn)):
+        raise RuntimeError("Database schema setup failed")
+    return True
+
 def register_user(conn, us_id, fis_id, email, password, first_name, last_name, dob, division, team, discipline):
     try:
         # Set empty optional fields to None
@@ -289,27 +485,30 @@ def register_user(conn, us_id, fis_id, email, password, first_name, last_name, d
         discipline_str = ", ".join(discipline) if discipline else None
         
         full_name = f"{first_name} {last_name}"
+        password_hash = password_hasher.hash(password)
         
         with conn.cursor() as cur:
+            # Insert and read back the assigned MEMBER_ID in one request
             cur.execute(
                 """
+                BEGIN;
                 INSERT INTO REGISTRATIONS 
                 (US_ID, FIS_ID, EMAIL, PASSWORD, FIRST_NAME, LAST_NAME, FULL_NAME, 
                  DOB, DIVISION, TEAM, DISCIPLINE)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (us_id, fis_id, email, password, first_name, last_name, full_name,
-                 dob, division, team, discipline_str)
-            )
-            conn.commit()
-            
-            # Get the assigned MEMBER_ID
-            cur.execute("""
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
                 SELECT MEMBER_ID 
                 FROM REGISTRATIONS 
-                WHERE EMAIL = %s
-            """, (email,))
-            
+                WHERE EMAIL = %s;
+                COMMIT;
+                """,
+                (us_id, fis_id, email, password_hash, first_name, last_name, full_name,
+                 dob, division, team, discipline_str, email),
+                num_statements=4,
+            )
+
+            # Skip the BEGIN and INSERT results to reach the SELECT
+            cur.nextset()
+            cur.nextset()
             member_id = cur.fetchone()[0]
             st.success(f"Registration successful! Your Member ID is: {member_id}")
             return True
@@ -320,30 +519,9 @@ def register_user(conn, us_id, fis_id, email, password, first_name, last_name, d
             conn.rollback()
         return False
             
-def verify_login(conn, email, password):
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT EMAIL, FIRST_NAME, LAST_NAME 
-                FROM REGISTRATIONS 
-                WHERE EMAIL = %s AND PASSWORD = %s
-                """,
-                (email, password)
-            )
-            result = cur.fetchone()
-            if result:
-                full_name = f"{result[1]} {result[2]}"
-                return True, full_name
-            return False, None
-    except Exception as e:
-        st.error(f"Login error: {e}")
-        return False, None
-
-def get_user_info(conn, email):
-    with conn.cursor() as cur:
-        cur.execute("""
+LOGIN_QUERY = """
         SELECT 
+            UID,
             MEMBER_ID, 
             EMAIL, 
             FIRST_NAME,
@@ -351,28 +529,77 @@ def get_user_info(conn, email):
             DOB,
             TEAM,
             DIVISION, 
-            DISCIPLINE
+            DISCIPLINE,
+            PASSWORD
         FROM REGISTRATIONS
         WHERE EMAIL = %s
-        """, (email,))
-        row = cur.fetchone()
-        if row:
-            return {
-                'Member ID': row[0],
-                'Email': row[1],
-                'Name': f"{row[2]} {row[3]}",
-                'DOB': row[4],
-                'Team': row[5],
-                'Division': row[6],
-                'Discipline': row[7]
-            }
-        return None
+        """
 
-def get_user_id(conn, email):
+def user_info_from_row(row):
+    if row:
+        return {
+            'Member ID': row[1],
+            'Email': row[2],
+            'Name': f"{row[3]} {row[4]}",
+            'DOB': row[5],
+            'Team': row[6],
+            'Division': row[7],
+            'Discipline': row[8]
+        }
+    return None
+
+def get_login_record(conn, email):
+    """Fetch the profile and stored password hash for an email"""
+    # Not cached: a cache would share credentials across sessions and
+    # keep serving a hash or profile after it changes
     with conn.cursor() as cur:
-        cur.execute("SELECT UID FROM REGISTRATIONS WHERE EMAIL = %s", (email,))
-        result = cur.fetchone()
-        return result[0] if result else None
+        cur.execute(LOGIN_QUERY, (email,))
+        return cur.fetchone()
+
+def check_password(stored_password, password):
+    """Check a password against its argon2 hash, accepting legacy plaintext rows"""
+    if not stored_password.startswith("$argon2"):
+        return hmac.compare_digest(stored_password.encode(), password.encode())
+    try:
+        return password_hasher.verify(stored_password, password)
+    except (VerifyMismatchError, InvalidHashError):
+        return False
+
+def upgrade_password_hash(conn, uid, stored_password, password):
+    """Re-hash a legacy plaintext or outdated-parameter password after a successful login"""
+    if stored_password.startswith("$argon2") and not password_hasher.check_needs_rehash(stored_password):
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE REGISTRATIONS SET PASSWORD = %s WHERE UID = %s",
+                (password_hasher.hash(password), uid),
+            )
+        conn.commit()
+    except Exception as e:
+        # The login itself succeeded; the upgrade is retried next time
+        print(f"Error upgrading password hash: {str(e)}")
+
+@st.cache_resource(show_spinner=False)
+def dummy_password_hash():
+    """Hash checked for unknown emails so they take as long as a wrong password"""
+    return password_hasher.hash(uuid.uuid4().hex)
+
+def login_and_fetch_profile(conn, email, password):
+    """Check credentials and return the user's profile, or None if they don't match"""
+    try:
+        result = get_login_record(conn, email)
+        if not result:
+            # Spend the same argon2 work as a real check to avoid leaking which emails exist
+            check_password(dummy_password_hash(), password)
+            return None
+        if check_password(result[9], password):
+            upgrade_password_hash(conn, result[0], result[9], password)
+            return {'UID': result[0], **user_info_from_row(result)}
+        return None
+    except Exception as e:
+        st.error(f"Login error: {e}")
+        return None
 
 # Events
 def add_event(conn, event_name, event_date, location, city, state, zip_code, venue, discipline, division, creator_id, fee=None, url=None):
@@ -400,7 +627,9 @@ def add_event(conn, event_name, event_date, location, city, state, zip_code, ven
             return False
             
         with conn.cursor() as cur:
+            # Insert and commit in one multi-statement request
             sql = """
+            BEGIN;
             INSERT INTO UPCOMING_EVENTS (
                 EVENT_NAME,
                 EVENT_DATE,
@@ -416,7 +645,8 @@ def add_event(conn, event_name, event_date, location, city, state, zip_code, ven
                 URL
             ) VALUES (
                 %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
+            );
+            COMMIT;
             """
             
             values = (
@@ -434,8 +664,9 @@ def add_event(conn, event_name, event_date, location, city, state, zip_code, ven
                 url
             )
             
-            cur.execute(sql, values)
-            conn.commit()
+            cur.execute(sql, values, num_statements=3)
+            # A new event has no registrations yet, so user listings stay valid
+            get_upcoming_events.clear()
             return True
             
     except Exception as e:
@@ -459,10 +690,11 @@ def edit_event(conn, event_id, event_name, event_date, location, city, state, zi
             cur.execute("""
             UPDATE UPCOMING_EVENTS 
             SET EVENT_NAME = %s, EVENT_DATE = %s, LOCATION = %s, CITY = %s, 
-                STATE = %s, ZIP = %s, VENUE = %s, DISCIPLINE = %s, DIVISION = %s, URL = %s
+                STATE = %s, ZIP = %s, VENUE = %s, DISCIPLINE = %s, DIVISION = %s, FEE = %s, URL = %s
             WHERE EVENT_ID = %s
             """, (event_name, event_date, location, city, state, zip_code, venue, discipline, division, fee, url, event_id))
             conn.commit()
+            clear_events_cache()
             return True
     except Exception as e:
         st.error(f"Error updating event: {e}")
@@ -471,174 +703,128 @@ def edit_event(conn, event_id, event_name, event_date, location, city, state, zi
 def delete_event(conn, event_id):
     try:
         with conn.cursor() as cur:
-            # First delete any registrations for this event
-            cur.execute("DELETE FROM EVENT_REGISTRATIONS WHERE EVENT_ID = %s", (event_id,))
-            # Then delete the event
-            cur.execute("DELETE FROM UPCOMING_EVENTS WHERE EVENT_ID = %s", (event_id,))
-            conn.commit()
+            # Delete the event's registrations, then the event, in one request
+            cur.execute(
+                """
+                BEGIN;
+                DELETE FROM EVENT_REGISTRATIONS WHERE EVENT_ID = %s;
+                DELETE FROM UPCOMING_EVENTS WHERE EVENT_ID = %s;
+                COMMIT;
+                """,
+                (event_id, event_id),
+                num_statements=4,
+            )
+            clear_events_cache()
             return True
     except Exception as e:
         st.error(f"Error deleting event: {e}")
         return False
 
-def register_for_event(conn, event_id, user_id):
+#PDF
+@st.cache_resource(show_spinner=False)
+def create_pdf_tables(_conn):
+    """Create tables for storing PDF content, once per process; failures raise so they are retried"""
     try:
-        with conn.cursor() as cur:
-            # Get the next available bib number for this event
-            cur.execute("""
-            SELECT COALESCE(MAX(BIB_NUMBER), 0) + 1
-            FROM EVENT_REGISTRATIONS
-            WHERE EVENT_ID = %s
-            """, (event_id,))
-            next_bib = cur.fetchone()[0]
-            
-            # Insert the new registration with bib number
-            cur.execute("""
-            INSERT INTO EVENT_REGISTRATIONS (EVENT_ID, USER_ID, BIB_NUMBER)
-            VALUES (%s, %s, %s)
-            """, (event_id, user_id, next_bib))
-            
-            # Update competitor count
-            cur.execute("""
-            UPDATE UPCOMING_EVENTS 
-            SET COMPETITOR_COUNT = (
-                SELECT COUNT(*) 
-                FROM EVENT_REGISTRATIONS 
-                WHERE EVENT_ID = %s
+        with _conn.cursor() as cur:
+            cur.execute(
+                """
+            CREATE TABLE IF NOT EXISTS PDF_DOCUMENTS (
+                DOC_ID INTEGER IDENTITY(1,1),
+                FILENAME VARCHAR NOT NULL,
+                CONTENT TEXT,
+                CONTENT_LENGTH INTEGER,
+                FILE_HASH VARCHAR,
+                TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
             )
-            WHERE EVENT_ID = %s
-            """, (event_id, event_id))
-            
-            conn.commit()
-            return True
-    except Exception as e:
-        if "duplicate key value violates unique constraint" in str(e).lower():
-            st.error("You are already registered for this event.")
-        else:
-            st.error(f"Error registering for event: {e}")
-        return False
-
-def unregister_from_event(conn, event_id, user_id):
-    try:
-        with conn.cursor() as cur:
-            # Remove registration
-            cur.execute("""
-            DELETE FROM EVENT_REGISTRATIONS 
-            WHERE EVENT_ID = %s AND USER_ID = %s
-            """, (event_id, user_id))
-            
-            # Update competitor count
-            cur.execute("""
-            UPDATE UPCOMING_EVENTS
-            SET COMPETITOR_COUNT = (
-                SELECT COUNT(*) 
-                FROM EVENT_REGISTRATIONS 
-                WHERE EVENT_ID = %s
+            """
             )
-            WHERE EVENT_ID = %s
-            """, (event_id, event_id))
-            
-            conn.commit()
-            return True
-    except Exception as e:
-        st.error(f"Error unregistering from event: {e}")
-        return False
 
-#PDF
-def create_pdf_tables(conn):
-    """Create tables for storing PDF content"""
-    try:
-        with conn.cursor() as cur:
+            # Bring tables created by earlier versions up to date
+            cur.execute(
+                "ALTER TABLE PDF_DOCUMENTS ADD COLUMN IF NOT EXISTS FILE_HASH VARCHAR"
+            )
+            cur.execute("ALTER TABLE PDF_DOCUMENTS DROP COLUMN IF EXISTS SECTIONS")
+            cur.execute(
+                "ALTER TABLE PDF_DOCUMENTS ADD COLUMN IF NOT EXISTS CONTENT_LENGTH INTEGER"
+            )
             cur.execute(
                 """
-            DROP TABLE IF EXISTS PDF_DOCUMENTS
+            UPDATE PDF_DOCUMENTS SET CONTENT_LENGTH = LENGTH(CONTENT)
+            WHERE CONTENT_LENGTH IS NULL
             """
             )
 
+            # One row per page, so text searches match and preview a page
+            # rather than a whole document
             cur.execute(
                 """
-            CREATE TABLE IF NOT EXISTS PDF_DOCUMENTS (
-                DOC_ID INTEGER IDENTITY(1,1),
+            CREATE TABLE IF NOT EXISTS PDF_PAGES (
                 FILENAME VARCHAR NOT NULL,
-                CONTENT TEXT,
-                SECTIONS TEXT,
-                TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+                PAGE_NO INTEGER NOT NULL,
+                CONTENT TEXT
             )
+            CLUSTER BY (FILENAME)
             """
             )
-            conn.commit()
-            return True
-    except Exception as e:
-        st.error(f"Error creating PDF tables: {str(e)}")
-        return False
 
-def process_pdf(conn, pdf_path, section_size=1000):
-    """Process a PDF and store its content with sections"""
-    try:
-        with open(pdf_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            full_text = ""
-
-            # Extract text from all pages
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:  # Only add if text was successfully extracted
-                    full_text += text + "\n"
-
-            # Store in database - first check if file already exists
-            filename = os.path.basename(pdf_path)
-            with conn.cursor() as cur:
-                # Check for existing file
+            # Index page text for SEARCH() and the ILIKE wildcard
+            # fallback; needs Enterprise edition
+            try:
                 cur.execute(
-                    "SELECT DOC_ID FROM PDF_DOCUMENTS WHERE FILENAME = %s", (filename,)
+                    """
+                ALTER TABLE PDF_PAGES
+                ADD SEARCH OPTIMIZATION ON FULL_TEXT(CONTENT), SUBSTRING(CONTENT)
+                """
                 )
-                existing = cur.fetchone()
-
-                if existing:
-                    # Update existing record
-                    cur.execute(
-                        """
-                    UPDATE PDF_DOCUMENTS
-                    SET CONTENT = %s,
-                        SECTIONS = %s,
-                        TIMESTAMP = CURRENT_TIMESTAMP()
-                    WHERE FILENAME = %s
-                    """,
-                        (full_text, full_text, filename),
-                    )
-                else:
-                    # Insert new record
-                    cur.execute(
-                        """
-                    INSERT INTO PDF_DOCUMENTS (FILENAME, CONTENT, SECTIONS)
-                    VALUES (%s, %s, %s)
-                    """,
-                        (filename, full_text, full_text),
-                    )
-
-            conn.commit()
-            st.success(f"Successfully processed PDF: {filename}")
+            except Exception as e:
+                print(f"Search optimization unavailable: {str(e)}")
+            _conn.commit()
             return True
     except Exception as e:
-        st.error(f"Error processing PDF: {str(e)}")
-        return False
-
-def get_relevant_content(conn, query):
-    """Get specific content from PDF based on query"""
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-            SELECT DISTINCT LEFT(CONTENT, 1000) as content_preview
-            FROM PDF_DOCUMENTS
-            WHERE CONTAINS(LOWER(CONTENT), LOWER(%s))
+        st.error(f"Error creating PDF tables: {str(e)}")
+        # Raise rather than return False so the failure isn't cached
+        raise
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def embed_query(_conn, query):
+    """Embed a normalized query string once and reuse the vector across reruns"""
+    with _conn.cursor() as cur:
+        cur.execute(f"SELECT {EMBED_SQL.format('%s')}", (query,))
+        return cur.fetchone()[0]
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def search_chunks(_conn, query):
+    """Rank stored chunks against a normalized query, cached per query"""
+    query_embedding = embed_query(_conn, query)
+    with _conn.cursor() as cur:
+        # Only rank chunks in the buckets nearest the query; fall back
+        # to a full scan until centroids have been built
+        cur.execute(
+            """
+            WITH q AS (
+                SELECT PARSE_JSON(%s)::VECTOR(FLOAT, 768) AS V
+            ),
+            probe AS (
+                SELECT c.CENTROID_ID
+                FROM EMBEDDING_CENTROIDS c, q
+                ORDER BY VECTOR_L2_DISTANCE(c.CENTROID, q.V)
+                LIMIT %s
+            )
+            SELECT LEFT(de.CONTENT_CHUNK, 1000) as content_preview
+            FROM DOCUMENT_EMBEDDINGS de, q
+            WHERE de.CENTROID_ID IN (SELECT CENTROID_ID FROM probe)
+               OR NOT EXISTS (SELECT 1 FROM probe)
+            ORDER BY VECTOR_COSINE_SIMILARITY(de.EMBEDDING, q.V) DESC
             LIMIT 3
             """,
-                (query,),
-            )
+            (json.dumps(query_embedding), EMBEDDING_PROBE_COUNT),
+        )
+        return [row[0] for row in cur.fetchall()]
 
-            results = cur.fetchall()
-            return [row[0] for row in results] if results else []
+def get_relevant_content(conn, query):
+    """Get the PDF chunks closest to the query embedding"""
+    try:
+        return search_chunks(conn, query.strip().lower())
     except Exception as e:
         st.error(f"Error retrieving content: {str(e)}")
         return []
@@ -669,7 +855,7 @@ def initialize_search(conn):
     """Initialize all application components"""
     try:
         # Create core tables
-        create_registration_table(conn)
+        bootstrap_schema(conn)
 
         # Create PDF tables and process documents
         create_pdf_tables(conn)
@@ -677,13 +863,13 @@ def initialize_search(conn):
         # Process PDFs in data directory
         pdf_dir = "data"
         if os.path.exists(pdf_dir):
-            pdfs_processed = False
-            for filename in os.listdir(pdf_dir):
-                if filename.lower().endswith(".pdf"):
-                    if process_pdf(conn, os.path.join(pdf_dir, filename)):
-                        pdfs_processed = True
+            pdf_paths = [
+                os.path.join(pdf_dir, filename)
+                for filename in os.listdir(pdf_dir)
+                if filename.lower().endswith(".pdf")
+            ]
 
-            if pdfs_processed:
+            if pdf_paths and process_pdfs(conn, pdf_paths):
                 st.success("PDF processing completed successfully")
         else:
             st.warning("No 'data' directory found for PDFs")
@@ -693,16 +879,16 @@ def initialize_search(conn):
         st.error(f"Error initializing app: {str(e)}")
         return False
 
-def save_chat_message(conn, user_id, message, is_bot=False):
-    """Save a chat message to the database"""
+def save_chat_messages(conn, rows):
+    """Save (user_id, message, is_bot) rows to the database in one batch"""
     try:
         with conn.cursor() as cur:
-            cur.execute(
+            cur.executemany(
                 """
             INSERT INTO CHAT_HISTORY (USER_ID, MESSAGE_TEXT, IS_BOT)
             VALUES (%s, %s, %s)
             """,
-                (user_id, message, is_bot),
+                rows,
             )
         conn.commit()
         return True
@@ -710,38 +896,94 @@ def save_chat_message(conn, user_id, message, is_bot=False):
         st.error(f"Error saving message: {str(e)}")
         return False
 
+# Replies kept so repeated questions skip Cortex, streamed or not
+CHAT_CACHE_TTL = 3600
+CHAT_CACHE_SIZE = 256
+
+@st.cache_resource
+def chat_response_cache():
+    """Process-wide LRU of recent Mistral replies, keyed by prompt"""
+    return {"lock": threading.Lock(), "entries": OrderedDict()}
+
+def cached_chat_response(message, system_prompt):
+    """The stored reply for a prompt, if one is younger than CHAT_CACHE_TTL"""
+    cache = chat_response_cache()
+    key = (system_prompt, message)
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+        if entry and time.monotonic() - entry[0] < CHAT_CACHE_TTL:
+            cache["entries"].move_to_end(key)
+            return entry[1]
+    return None
+
+def store_chat_response(message, system_prompt, response):
+    """Remember a complete reply, evicting the least recently used beyond CHAT_CACHE_SIZE"""
+    cache = chat_response_cache()
+    key = (system_prompt, message)
+    with cache["lock"]:
+        cache["entries"][key] = (time.monotonic(), response)
+        cache["entries"].move_to_end(key)
+        while len(cache["entries"]) > CHAT_CACHE_SIZE:
+            cache["entries"].popitem(last=False)
+
+def complete_chat(conn, message, system_prompt):
+    """Run a Mistral completion in one blocking query"""
+    with conn.cursor() as cur:
+        # Use the SQL version that we know works
+        cur.execute("""
+            SELECT SNOWFLAKE.CORTEX.COMPLETE(
+                'mistral-large2',
+                CONCAT(%s, ' ', %s)
+            )
+        """, (system_prompt, message))
+        return cur.fetchone()[0]
+
 def get_chat_response(conn, message, system_prompt="You are a helpful ski racing assistant.", temperature=0.7, max_tokens=1000):
     """Generate response using Mistral"""
+    response = cached_chat_response(message, system_prompt)
+    if response is not None:
+        return response
     try:
-        with conn.cursor() as cur:
-            # Use the SQL version that we know works
-            cur.execute("""
-                SELECT SNOWFLAKE.CORTEX.COMPLETE(
-                    'mistral-large2',
-                    CONCAT(%s, ' ', %s)
-                )
-            """, (system_prompt, message))
-            response = cur.fetchone()[0]
-            return response
+        response = complete_chat(conn, message, system_prompt)
+        store_chat_response(message, system_prompt, response)
+        return response
     except Exception as e:
         print(f"Error in chat response: {str(e)}")  # For debugging
         return "So sorry for the inconvenience, but I'm having trouble accessing the chat system and working in limited capacityat the moment. Could you please try again in a little while?"
 
+def stream_chat_response(message, system_prompt="You are a helpful ski racing assistant."):
+    """Yield a Mistral response piece by piece as Cortex generates it"""
+    from snowflake.cortex import Complete
+
+    return Complete(
+        "mistral-large2",
+        f"{system_prompt} {message}",
+        session=create_cortex_session(),
+        stream=True,
+    )
+
+def pdf_text_predicate(query):
+    """WHERE condition for a PDF text search: tokenized SEARCH, or ILIKE for an explicit % pattern"""
+    # Only % marks a pattern; an underscore is ordinary text for SEARCH()
+    if "%" in query:
+        return "CONTENT ILIKE %s"
+    return "SEARCH(CONTENT, %s)"
+
 def test_search(conn, query):
     """Test function to verify search functionality"""
     with conn.cursor() as cur:
         cur.execute(
-            """
-        SELECT LEFT(content, 1000) 
-        FROM pdf_documents 
-        WHERE content ILIKE %s
+            f"""
+        SELECT FILENAME, PAGE_NO, LEFT(CONTENT, 1000) 
+        FROM PDF_PAGES 
+        WHERE {pdf_text_predicate(query)}
         """,
-            (f"%{query}%",),
+            (query,),
         )
 
         result = cur.fetchone()
         if result:
-            print(f"Found content for '{query}': {result[0][:200]}...")
+            print(f"Found content for '{query}' in {result[0]} p.{result[1]}: {result[2][:200]}...")
         else:
             print(f"No content found for '{query}'")
 
@@ -763,88 +1005,86 @@ def debug_pdf_content(conn):
         return False
 
 def chat_interface(conn):
-    """Display the chat interface with Mistral Large 2 integration"""
+    """Display the chat interface and return a newly submitted message, if any"""
 
     with st.form(key="chat_form", clear_on_submit=True):
         user_input = st.text_area("Ask Nickane about ski racing", key="chat_input")
         submit_button = st.form_submit_button("Submit")
-        
-        if submit_button and user_input:
-            st.session_state.message_submitted = True
-            st.session_state.last_message = user_input
     
-    if st.session_state.message_submitted:
-        user_id = None
-        if st.session_state.logged_in:
-            user_id = get_user_id(conn, st.session_state.user_email)
-        
-        # Add user message to history
+    # Add the user message now; display_chat_history renders it below
+    if submit_button and user_input:
         st.session_state.chat_history.append({
-            "text": st.session_state.last_message,
+            "text": user_input,
             "is_bot": False
         })
-        
-        # Save user message if logged in
-        if user_id:
-            save_chat_message(conn, user_id, st.session_state.last_message)
-        
-        # Get and display bot response using Mistral Large 2
-        bot_response = get_chat_response(conn, st.session_state.last_message)
-        st.session_state.chat_history.append({
-            "text": bot_response,
-            "is_bot": True
-        })
-        
-        # Save bot response if user is logged in
-        if user_id:
-            save_chat_message(conn, user_id, bot_response, is_bot=True)
-        
-        st.session_state.message_submitted = False
-        st.rerun()
+        return user_input
+    return None
 
 
-if "active_tab" not in st.session_state:
-    st.session_state.active_tab = 0  # Default to first tab
+def reply_to_chat(conn, user_input, system_prompt="You are a helpful ski racing assistant."):
+    """Show the Mistral Large 2 reply below the history, then record the exchange"""
+    received = []
+
+    def tracked_stream():
+        for piece in stream_chat_response(user_input, system_prompt):
+            received.append(piece)
+            yield piece
+
+    with st.chat_message("assistant", avatar="🤖"):
+        # Repeated questions are answered from the cache; only misses stream
+        bot_response = cached_chat_response(user_input, system_prompt)
+        if bot_response is not None:
+            st.markdown(bot_response)
+        else:
+            try:
+                bot_response = st.write_stream(tracked_stream())
+                store_chat_response(user_input, system_prompt, bot_response)
+            except Exception as e:
+                print(f"Error streaming chat response: {str(e)}")  # For debugging
+                if received:
+                    # Keep the partial answer already on screen rather than
+                    # writing a second one under it
+                    bot_response = "".join(received)
+                else:
+                    bot_response = get_chat_response(conn, user_input, system_prompt)
+                    st.markdown(bot_response)
+
+    st.session_state.chat_history.append({
+        "text": bot_response,
+        "is_bot": True
+    })
+
+    # Save both sides of the exchange in one batch if logged in
+    if st.session_state.logged_in:
+        user_id = st.session_state.user_profile["UID"]
+        save_chat_messages(
+            conn,
+            [
+                (user_id, user_input, False),
+                (user_id, bot_response, True),
+            ],
+        )
 
 
 def display_chat_history():
     """Display chat history in collapsible window"""
-    # When new message is added, set active tab to Chat (index 3)
-    if st.session_state.message_submitted:
-        st.session_state.active_tab = 3
-        
-    for message in st.session_state.chat_history:
+    history = st.session_state.chat_history
+    for message in islice(history, max(len(history) - CHAT_DISPLAY_LIMIT, 0), None):
         if message["is_bot"]:
-            st.markdown(f"""
-                <div style='background-color: #f0f2f6; padding: 10px; border-radius: 5px; margin: 5px 0;'>
-                    🤖 <b>Nickane:</b> {message["text"]}
-                </div>
-                """, unsafe_allow_html=True)
+            with st.chat_message("assistant", avatar="🤖"):
+                st.markdown(message["text"])
         else:
-            st.markdown(f"""
-                <div style='background-color: #e8f0fe; padding: 10px; border-radius: 5px; margin: 5px 0;'>
-                    👤 <b>You:</b> {message["text"]}
-                </div>
-                """, unsafe_allow_html=True)
+            with st.chat_message("user", avatar="👤"):
+                st.markdown(message["text"])
 
 # Test PDF content directly
 def test_pdf_search(conn, query):
     """Test function to directly search PDF content"""
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-            SELECT CONTENT
-            FROM PDF_DOCUMENTS
-            WHERE CONTAINS(LOWER(CONTENT), LOWER(%s))
-            LIMIT 1
-            """,
-                (query,),
-            )
-            result = cur.fetchone()
-            if result:
-                return f"Found matching content: {result[0][:200]}..."
-            return "No matching content found"
+        results = search_chunks(conn, query.strip().lower())
+        if results:
+            return f"Found matching content: {results[0][:200]}..."
+        return "No matching content found"
     except Exception as e:
         return f"Error testing PDF search: {str(e)}"
 
@@ -877,29 +1117,40 @@ def verify_pdf_content(conn):
 
         return True
 
+# Shorter queries match nearly every page, so they only search filenames
+MIN_TEXT_SEARCH_LENGTH = 3
+
+def search_pdf_filenames(conn, query):
+    """Stored PDF filenames containing the query"""
+    # Escape the query so % and _ in it match literally
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT FILENAME FROM PDF_DOCUMENTS WHERE FILENAME ILIKE %s ESCAPE '\\\\'",
+            (f"%{escaped}%",),
+        )
+        return [row[0] for row in cur.fetchall()]
+
 def direct_pdf_search(conn, query):
     """Direct search in PDF content"""
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-            SELECT FILENAME, LEFT(CONTENT, 200)
-            FROM PDF_DOCUMENTS
-            WHERE CONTAINS(CONTENT, %s)
-               OR CONTENT ILIKE %s
-            """,
-                (query, f"%{query}%"),
-            )
-
-            results = cur.fetchall()
-            if results:
-                for filename, preview in results:
-                    st.write(f"Match in {filename}:")
-                    st.write(preview + "...")
-                return True
-            else:
+        query = query.strip() if query else ""
+        if len(query) < MIN_TEXT_SEARCH_LENGTH:
+            filenames = search_pdf_filenames(conn, query) if query else []
+            for filename in filenames:
+                st.write(f"Match in {filename}")
+            if not filenames:
                 st.write("No matches found.")
-                return False
+            return bool(filenames)
+
+        results = search_chunks(conn, query.lower())
+        if results:
+            for preview in results:
+                st.write(preview[:200] + "...")
+            return True
+        else:
+            st.write("No matches found.")
+            return False
     except Exception as e:
         st.error(f"Search error: {str(e)}")
         return False
@@ -907,22 +1158,28 @@ def direct_pdf_search(conn, query):
 def test_chat_search(conn, query):
     """Test search functionality directly"""
     try:
+        query = query.strip() if query else ""
+        if len(query) < MIN_TEXT_SEARCH_LENGTH:
+            filenames = search_pdf_filenames(conn, query) if query else []
+            st.write(f"\nFilename matches for '{query}': {', '.join(filenames) or 'none'}")
+            return True
+
         with conn.cursor() as cur:
-            # Test simple ILIKE search
+            # Test the full-text search
             cur.execute(
-                """
-            SELECT LEFT(content, 500)
-            FROM pdf_documents
-            WHERE content ILIKE %s
+                f"""
+            SELECT FILENAME, PAGE_NO, LEFT(CONTENT, 500)
+            FROM PDF_PAGES
+            WHERE {pdf_text_predicate(query)}
             LIMIT 1
             """,
-                (f"%{query}%",),
+                (query,),
             )
 
             result = cur.fetchone()
             if result:
-                st.write(f"\nFound matching content for '{query}':")
-                st.write(result[0])
+                st.write(f"\nFound matching content for '{query}' in {result[0]}, page {result[1]}:")
+                st.write(result[2])
             else:
                 st.write(f"\nNo direct matches found for '{query}'")
 
@@ -935,24 +1192,23 @@ def diagnose_pdf_system(conn):
     """Diagnose PDF storage and search system"""
     try:
         st.write("Running PDF system diagnostics...")
+        # Adds and back-fills CONTENT_LENGTH on tables from earlier versions
+        create_pdf_tables(conn)
 
-        # 1. Check table structure
+        # 1. Check table structure from metadata, without scanning the table
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT column_name, data_type 
-                FROM information_schema.columns 
-                WHERE table_name = 'PDF_DOCUMENTS'
-            """)
+            cur.execute("SHOW COLUMNS IN TABLE PDF_DOCUMENTS")
             columns = cur.fetchall()
             st.write("Table structure:")
             for col in columns:
-                st.write(f"- {col[0]}: {col[1]}")
+                # column_name, then data_type as a JSON description
+                st.write(f"- {col[2]}: {json.loads(col[3])['type']}")
 
-        # 2. Check document details with corrected query
+        # 2. Check document details; lengths are stored at ingest
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT filename, 
-                       LENGTH(content) as content_length,
+                       content_length,
                        LEFT(content, 200) as content_preview
                 FROM pdf_documents
             """)
@@ -982,11 +1238,22 @@ def initialize_search_system(conn):
             st.error(f"Directory not found: {pdf_dir}")
             return False
 
-        # Process each PDF
-        for filename in os.listdir(pdf_dir):
-            if filename.lower().endswith(".pdf"):
-                file_path = os.path.join(pdf_dir, filename)
-                process_pdf(conn, file_path)
+        # Process all PDFs in one batch
+        pdf_paths = [
+            os.path.join(pdf_dir, filename)
+            for filename in os.listdir(pdf_dir)
+            if filename.lower().endswith(".pdf")
+        ]
+        if pdf_paths:
+            # Embed the chunks that the search test below ranks
+            bootstrap_schema(conn)
+            loaded_paths = process_pdfs(conn, pdf_paths)
+            for pdf_path in loaded_paths:
+                process_pdf_with_embeddings(conn, pdf_path)
+
+            # Re-pick centroids from the new chunks and re-bucket them all
+            if loaded_paths:
+                build_embedding_centroids(conn)
 
         # Verify content
         if not verify_pdf_content(conn):
@@ -1002,62 +1269,189 @@ def initialize_search_system(conn):
         st.error(f"Error initializing search: {str(e)}")
         return False
 
-def process_pdf(conn, pdf_path):
-    """Process a PDF and store its content"""
-    try:
-        with open(pdf_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            full_text = ""
+def extract_pdf_text(pdf_path):
+    """Extract the text of every page in a PDF"""
+    # Large PDFs are split across processes, which need an importable module
+    from pdf_text import extract_text
+
+    return extract_text(pdf_path)
+
+def extract_pdf_pages(pdf_path):
+    """Extract the text of each page in a PDF"""
+    from pdf_text import extract_page_texts
+
+    return extract_page_texts(pdf_path)
+
+def file_hash(path):
+    """Hex blake2b digest of a file's bytes"""
+    with open(path, "rb") as file:
+        return hashlib.blake2b(file.read()).hexdigest()
+
+def changed_pdfs(conn, pdf_paths):
+    """Map each PDF whose bytes differ from the stored copy to its new hash"""
+    hashes = {pdf_path: file_hash(pdf_path) for pdf_path in pdf_paths}
+    filenames = [os.path.basename(pdf_path) for pdf_path in pdf_paths]
+    with conn.cursor() as cur:
+        placeholders = ", ".join(["%s"] * len(filenames))
+        cur.execute(
+            f"SELECT FILENAME, FILE_HASH FROM PDF_DOCUMENTS WHERE FILENAME IN ({placeholders})",
+            tuple(filenames),
+        )
+        stored = dict(cur.fetchall())
+    return {
+        pdf_path: digest
+        for pdf_path, digest in hashes.items()
+        if stored.get(os.path.basename(pdf_path)) != digest
+    }
 
-            # Extract text from all pages
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n"
+def process_pdfs(conn, pdf_paths):
+    """Bulk load new or changed PDFs through a stage; returns the paths loaded"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
+    try:
+        # Skip extraction entirely for files already stored unchanged
+        pending = changed_pdfs(conn, pdf_paths)
+
+        loaded_paths = []
+        filenames = []
+        contents = []
+        file_hashes = []
+        page_filenames = []
+        page_numbers = []
+        page_contents = []
+        for pdf_path, digest in pending.items():
+            pages = extract_pdf_pages(pdf_path)
+            full_text = "\n".join(pages)
             if not full_text.strip():
                 st.error(f"No text extracted from {pdf_path}")
-                return False
+                continue
+            filename = os.path.basename(pdf_path)
+            loaded_paths.append(pdf_path)
+            filenames.append(filename)
+            contents.append(full_text)
+            file_hashes.append(digest)
+            page_filenames.extend([filename] * len(pages))
+            page_numbers.extend(range(1, len(pages) + 1))
+            page_contents.extend(pages)
+
+        if not filenames:
+            return []
+
+        # Write the batch as Parquet, stage it once and load it with one COPY
+        # per table
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            batch_id = uuid.uuid4().hex
+            batch_name = f"pdf_batch_{batch_id}.parquet"
+            pages_name = f"pdf_pages_{batch_id}.parquet"
+            pq.write_table(
+                pa.table(
+                    {
+                        "FILENAME": filenames,
+                        "CONTENT": contents,
+                        "CONTENT_LENGTH": [len(content) for content in contents],
+                        "FILE_HASH": file_hashes,
+                    }
+                ),
+                os.path.join(tmp_dir, batch_name),
+                compression="snappy",
+            )
+            pq.write_table(
+                pa.table(
+                    {
+                        "FILENAME": page_filenames,
+                        "PAGE_NO": page_numbers,
+                        "CONTENT": page_contents,
+                    }
+                ),
+                os.path.join(tmp_dir, pages_name),
+                compression="snappy",
+            )
 
-            # Store in database
             with conn.cursor() as cur:
-                # Remove existing entry if any
                 cur.execute(
-                    "DELETE FROM PDF_DOCUMENTS WHERE FILENAME = %s",
-                    (os.path.basename(pdf_path),),
+                    f"PUT 'file://{tmp_dir.replace(os.sep, '/')}/*.parquet' @~/pdf_stage "
+                    "AUTO_COMPRESS=FALSE OVERWRITE=TRUE"
                 )
 
-                # Insert new content
+                # Remove existing entries for the files being reloaded
+                placeholders = ", ".join(["%s"] * len(filenames))
+                for table in ("PDF_DOCUMENTS", "PDF_PAGES"):
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE FILENAME IN ({placeholders})",
+                        tuple(filenames),
+                    )
+
                 cur.execute(
-                    """
-                INSERT INTO PDF_DOCUMENTS (FILENAME, CONTENT)
-                VALUES (%s, %s)
-                """,
-                    (os.path.basename(pdf_path), full_text),
+                    f"""
+                COPY INTO PDF_DOCUMENTS (FILENAME, CONTENT, CONTENT_LENGTH, FILE_HASH)
+                FROM (
+                    SELECT
+                        $1:FILENAME::VARCHAR,
+                        $1:CONTENT::VARCHAR,
+                        $1:CONTENT_LENGTH::INTEGER,
+                        $1:FILE_HASH::VARCHAR
+                    FROM @~/pdf_stage/{batch_name}
+                )
+                FILE_FORMAT = (TYPE = PARQUET)
+                PURGE = TRUE
+                """
+                )
+                cur.execute(
+                    f"""
+                COPY INTO PDF_PAGES (FILENAME, PAGE_NO, CONTENT)
+                FROM (
+                    SELECT $1:FILENAME::VARCHAR, $1:PAGE_NO::INTEGER, $1:CONTENT::VARCHAR
+                    FROM @~/pdf_stage/{pages_name}
+                )
+                FILE_FORMAT = (TYPE = PARQUET)
+                PURGE = TRUE
+                """
                 )
 
-            conn.commit()
-            st.success(f"Processed PDF: {os.path.basename(pdf_path)}")
+        conn.commit()
+        for filename, full_text in zip(filenames, contents):
+            st.success(f"Processed PDF: {filename}")
             st.write(f"Extracted {len(full_text)} characters")
-            return True
+        return loaded_paths
 
     except Exception as e:
-        st.error(f"Error processing PDF: {str(e)}")
-        return False
+        st.error(f"Error processing PDFs: {str(e)}")
+        return []
 
 # Event registration
+# Low-cardinality text columns stored as categories to shrink cached frames
+EVENT_CATEGORY_DTYPES = {
+    "State": "category",
+    "Division": "category",
+    "Discipline": "category",
+}
+
+@st.cache_data(ttl=60, show_spinner=False)
 def get_upcoming_events(
-    conn, search_term=None, state_filter=None, discipline_filter=None
+    _conn,
+    search_term=None,
+    state_filter=None,
+    discipline_filter=None,
+    user_id=None,
+    limit=EVENT_LIST_LIMIT,
 ):
-    """Get upcoming events with optional filters"""
+    """Get the soonest upcoming events with optional filters, cached per filter combination.
+
+    When user_id is given, each row also says whether that user is registered.
+    """
     try:
-        with conn.cursor() as cur:
+        with _conn.cursor() as cur:
             query = """
             SELECT 
-                EVENT_ID,
+                ue.EVENT_ID,
                 EVENT_NAME,
                 EVENT_DATE,
-                COMPETITOR_COUNT,
+                (
+                    SELECT COUNT(*)
+                    FROM EVENT_REGISTRATIONS er
+                    WHERE er.EVENT_ID = ue.EVENT_ID
+                ) AS COMPETITOR_COUNT,
                 LOCATION,
                 CITY,
                 STATE,
@@ -1066,19 +1460,33 @@ def get_upcoming_events(
                 DIVISION,
                 DISCIPLINE,
                 URL,
-                CREATOR_ID
-            FROM UPCOMING_EVENTS
-            WHERE 1=1
+                CREATOR_ID,
+                mine.USER_ID IS NOT NULL AS IS_REGISTERED
+            FROM UPCOMING_EVENTS ue
+            LEFT JOIN EVENT_REGISTRATIONS mine
+                ON mine.EVENT_ID = ue.EVENT_ID AND mine.USER_ID = %s
+            WHERE EVENT_DATE >= CURRENT_DATE()
             """
-            params = []
+            params = [user_id]
 
             if search_term:
-                query += """ AND (
-                    LOWER(EVENT_NAME) LIKE %s 
-                    OR LOWER(CITY) LIKE %s 
-                    OR LOWER(VENUE) LIKE %s
+                quoted = len(search_term) > 1 and search_term[0] == search_term[-1] == '"'
+                if quoted:
+                    # A quoted term must equal a whole value, case-insensitively;
+                    # a plain comparison keeps % and _ literal
+                    query += """ AND (
+                    LOWER(EVENT_NAME) = LOWER(%s)
+                    OR LOWER(CITY) = LOWER(%s)
+                    OR LOWER(VENUE) = LOWER(%s)
+                )"""
+                    search_pattern = search_term[1:-1]
+                else:
+                    query += """ AND (
+                    EVENT_NAME ILIKE %s 
+                    OR CITY ILIKE %s 
+                    OR VENUE ILIKE %s
                 )"""
-                search_pattern = f"%{search_term.lower()}%"
+                    search_pattern = f"%{search_term}%"
                 params.extend([search_pattern, search_pattern, search_pattern])
 
             if state_filter:
@@ -1089,9 +1497,10 @@ def get_upcoming_events(
                 query += " AND DISCIPLINE = %s"
                 params.append(discipline_filter)
 
-            query += " ORDER BY EVENT_DATE"
+            query += " ORDER BY EVENT_DATE LIMIT %s"
+            params.append(limit)
 
-            cur.execute(query, tuple(params) if params else ())
+            cur.execute(query, tuple(params))
             rows = cur.fetchall()
             if rows:
                 return pd.DataFrame(
@@ -1110,65 +1519,59 @@ def get_upcoming_events(
                         "Discipline",
                         "URL",
                         "Creator ID",
+                        "Registered",
                     ],
-                )
+                ).astype(EVENT_CATEGORY_DTYPES)
             return None
     except Exception as e:
         st.error(f"Error retrieving events: {str(e)}")
         return None
 
+def clear_events_cache():
+    """Drop cached event listings after a write so the next read hits Snowflake"""
+    get_upcoming_events.clear()
+    get_user_events.clear()
+
 def register_for_event(conn, event_id, user_id):
     """Register a user for an event"""
     try:
         with conn.cursor() as cur:
-            # Get the next available bib number for this event
-            cur.execute(
-                """
-            SELECT COALESCE(MAX(BIB_NUMBER), 0) + 1
-            FROM EVENT_REGISTRATIONS
-            WHERE EVENT_ID = %s
-            """,
-                (event_id,),
-            )
-            next_bib = cur.fetchone()[0]
-
-            # Insert the new registration with bib number
+            # Assign the next bib number in the same statement as the insert;
+            # competitor counts are derived from EVENT_REGISTRATIONS on read.
+            # Snowflake doesn't enforce UNIQUE, so the HAVING skips the insert
+            # when the user is already registered. This is best-effort: two
+            # concurrent submits can both pass it.
             cur.execute(
                 """
             INSERT INTO EVENT_REGISTRATIONS (EVENT_ID, USER_ID, BIB_NUMBER)
-            VALUES (%s, %s, %s)
-            """,
-                (event_id, user_id, next_bib),
-            )
-
-            # Update competitor count
-            cur.execute(
-                """
-            UPDATE UPCOMING_EVENTS 
-            SET COMPETITOR_COUNT = (
-                SELECT COUNT(*) 
-                FROM EVENT_REGISTRATIONS 
-                WHERE EVENT_ID = %s
-            )
+            SELECT %s, %s, COALESCE(MAX(BIB_NUMBER), 0) + 1
+            FROM EVENT_REGISTRATIONS
             WHERE EVENT_ID = %s
+            HAVING COUNT_IF(USER_ID = %s) = 0
             """,
-                (event_id, event_id),
+                (event_id, user_id, event_id, user_id),
             )
+            if cur.rowcount == 0:
+                conn.rollback()
+                st.error("You are already registered for this event.")
+                return False
 
             conn.commit()
+            clear_events_cache()
             return True
     except Exception as e:
         if "duplicate key value violates unique constraint" in str(e).lower():
             st.error("You are already registered for this event.")
         else:
             st.error(f"Error registering for event: {e}")
+        if conn:
+            conn.rollback()
         return False
 
 def unregister_from_event(conn, event_id, user_id):
     """Unregister a user from an event"""
     try:
         with conn.cursor() as cur:
-            # Remove registration
             cur.execute(
                 """
             DELETE FROM EVENT_REGISTRATIONS 
@@ -1177,37 +1580,23 @@ def unregister_from_event(conn, event_id, user_id):
                 (event_id, user_id),
             )
 
-            # Update competitor count
-            cur.execute(
-                """
-            UPDATE UPCOMING_EVENTS
-            SET COMPETITOR_COUNT = (
-                SELECT COUNT(*) 
-                FROM EVENT_REGISTRATIONS 
-                WHERE EVENT_ID = %s
-            )
-            WHERE EVENT_ID = %s
-            """,
-                (event_id, event_id),
-            )
-
             conn.commit()
+            clear_events_cache()
             return True
     except Exception as e:
         st.error(f"Error unregistering from event: {e}")
         return False
 
-def get_user_events(conn, user_id):
-    """Get all events a user is registered for"""
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
+USER_EVENTS_QUERY = """
             SELECT 
                 ue.EVENT_ID,
                 ue.EVENT_NAME,
                 ue.EVENT_DATE,
-                ue.COMPETITOR_COUNT,
+                (
+                    SELECT COUNT(*)
+                    FROM EVENT_REGISTRATIONS c
+                    WHERE c.EVENT_ID = ue.EVENT_ID
+                ) AS COMPETITOR_COUNT,
                 ue.LOCATION,
                 ue.CITY,
                 ue.STATE,
@@ -1221,38 +1610,48 @@ def get_user_events(conn, user_id):
             JOIN EVENT_REGISTRATIONS er ON ue.EVENT_ID = er.EVENT_ID
             WHERE er.USER_ID = %s
             ORDER BY ue.EVENT_DATE
-            """,
-                (user_id,),
-            )
+            """
 
-            rows = cur.fetchall()
-            if rows:
-                return pd.DataFrame(
-                    rows,
-                    columns=[
-                        "Event ID",
-                        "Event Name",
-                        "Event Date",
-                        "Competitor Count",
-                        "Location",
-                        "City",
-                        "State",
-                        "ZIP",
-                        "Venue",
-                        "Discipline",
-                        "URL",
-                        "Registration Date",
-                        "Bib Number",
-                    ],
-                )
-            return None
+def user_events_from_rows(rows):
+    if rows:
+        return pd.DataFrame(
+            rows,
+            columns=[
+                "Event ID",
+                "Event Name",
+                "Event Date",
+                "Competitor Count",
+                "Location",
+                "City",
+                "State",
+                "ZIP",
+                "Venue",
+                "Discipline",
+                "URL",
+                "Registration Date",
+                "Bib Number",
+            ],
+        ).astype({"State": "category", "Discipline": "category"})
+    return None
+
+@st.cache_data(ttl=120, show_spinner=False)
+def get_user_events(_conn, user_id):
+    """Get all events a user is registered for, cached per user"""
+    try:
+        with _conn.cursor() as cur:
+            cur.execute(USER_EVENTS_QUERY, (user_id,))
+            return user_events_from_rows(cur.fetchall())
     except Exception as e:
         st.error(f"Error fetching user events: {e}")
         return None
 
-# Connect to Snowflake and initialize
-conn = create_connection()
-create_registration_table(conn)
+# Check out a pooled connection for this script run and initialize
+conn = create_connection_pool().raw_connection()
+try:
+    bootstrap_schema(conn)
+except RuntimeError:
+    # The failing step has already shown its error; the next run retries
+    pass
 
 #if initialize_search_system(conn):
 # st.success("Search system initialized successfully")
@@ -1319,102 +1718,161 @@ def main():
         
 
 
-        # Tabs for login and registration
-        tab1, tab2, tab3, tab4 = st.tabs(["Events", "Register", "Login", "Chat"])
+        # Sections for login and registration
+        section = select_section(["Events", "Register", "Login", "Chat"])
 
-        with tab1:
-            display_events_tab(conn)
-        with tab2:
+        if section == "Events":
+            display_events_tab()
+        elif section == "Register":
             display_registration_tab(conn)
-        with tab3:
+        elif section == "Login":
             display_login_tab(conn)
-        with tab4:
-            chat_interface(conn)
-            display_chat_history()
+        else:
+            chat_pane()
 
     else:
-        
+        # Sections for logged-in users
+        section = select_section(["Profile", "Events", "New Event", "Chat"])
+
+        if section == "Profile":
+            display_profile_tab()
+        elif section == "Events":
+            display_events_tab(show_registration=True)
+        elif section == "New Event":
+            display_new_event_tab()
+        else:
+            chat_pane()
+
+def select_section(options):
+    """Tab-style selector; unlike st.tabs, only the chosen section runs"""
+    # Fall back to the first section when switching between guest and member views
+    if st.session_state.get("active_tab") not in options:
+        st.session_state.active_tab = options[0]
+    return st.radio(
+        "Section",
+        options,
+        horizontal=True,
+        key="active_tab",
+        label_visibility="collapsed",
+    )
 
-        # Create tabs for different sections
-        tab1, tab2, tab3, tab4 = st.tabs(["Profile", "Events", "New Event", "Chat"])
+def pooled_fragment(render):
+    """Run a section as an st.fragment that checks out its own connection.
 
-        with tab1:
-            display_profile_tab(conn)
-    
-        with tab2:
-            display_events_tab(conn, show_registration=True)
-    
-        with tab3:
-            display_new_event_tab(conn)
+    Fragment reruns skip main(), and by then the script-run connection has
+    already been handed back to the pool, so each rerun borrows a fresh one.
+    """
+
+    @st.fragment
+    @functools.wraps(render)
+    def fragment(*args, **kwargs):
+        fragment_conn = create_connection_pool().raw_connection()
+        try:
+            render(fragment_conn, *args, **kwargs)
+        finally:
+            fragment_conn.close()
 
-        with tab4:
-            chat_interface(conn)
-            display_chat_history()
+    return fragment
 
+
+@pooled_fragment
+def chat_pane(conn):
+    """Chat form and recent history; sending a message reruns only this pane"""
+    user_input = chat_interface(conn)
+    display_chat_history()
+    if user_input:
+        reply_to_chat(conn, user_input)
+
+
+@pooled_fragment
 def display_events_tab(conn, show_registration=False):
     st.header("Upcoming Events")
 
-    # Filters
-    col1, col2 = st.columns(2)
-    with col1:
-        search = st.text_input(
-            "Search events", placeholder="Enter event name, city, or venue..."
-        )
-    with col2:
-        discipline_filter = st.selectbox(
-            "Filter by Discipline",
-            options=["All"]
-            + [
-                "Alpine",
-                "Combined Alpine",
-                "Downhill",
-                "Giant Slalom",
-                "Slalom",
-                "Super G",
-            ],
-        )
+    # Filters are applied together on submit rather than on every edit
+    with st.form("event_search_form"):
+        col1, col2 = st.columns(2)
+        with col1:
+            search = st.text_input(
+                "Search events",
+                placeholder="Enter event name, city, or venue...",
+                help='Wrap a term in quotes, like "Aspen", to match it exactly',
+            )
+        with col2:
+            discipline_filter = st.selectbox(
+                "Filter by Discipline",
+                options=DISCIPLINE_FILTER_OPTIONS,
+            )
+        st.form_submit_button("Search")
 
     # Get filtered events
     discipline = None if discipline_filter == "All" else discipline_filter
+    selectable = show_registration and st.session_state.logged_in
+    user_id = st.session_state.user_profile["UID"] if selectable else None
     events = get_upcoming_events(
-        conn, search_term=search if search else None, discipline_filter=discipline
+        conn,
+        search_term=search if search else None,
+        discipline_filter=discipline,
+        user_id=user_id,
     )
 
     if events is not None:
-        for _, row in events.iterrows():
-            st.write("---")
-            col1, col2 = st.columns([3, 1])
-
-            with col1:
-                st.subheader(row["Event Name"])
-                st.write(f"**Date:** {row['Event Date'].strftime('%B %d, %Y')}")
-                st.write(f"**Venue:** {row['Venue']}")
-                st.write(f"**Location:** {row['City']}, {row['State']}")
-                st.write(f"**Discipline:** {row['Discipline']}")
-                st.write(f"**Competitors:** {row['Competitor Count']}")
-                if pd.notna(row["URL"]):
-                    st.write(f"**More Info:** [{row['URL']}]({row['URL']})")
-
-            if show_registration and st.session_state.logged_in:
-                with col2:
-                    event_id = row["Event ID"]
-                    user_id = get_user_id(conn, st.session_state.user_email)
-                    user_events = get_user_events(conn, user_id)
-                    is_registered = (
-                        user_events is not None
-                        and event_id in user_events["Event ID"].values
-                    )
+        # Build the display columns in one vectorized pass
+        listing = events.assign(
+            Location=events["City"] + ", " + events["State"].astype(str)
+        )[
+            [
+                "Event Name",
+                "Event Date",
+                "Venue",
+                "Location",
+                "Discipline",
+                "Competitor Count",
+                "URL",
+            ]
+            + (["Registered"] if selectable else [])
+        ]
+        event_list = st.dataframe(
+            listing,
+            column_config={
+                "Event Date": st.column_config.DateColumn(
+                    "Date", format="MMMM DD, YYYY"
+                ),
+                "Competitor Count": st.column_config.NumberColumn(
+                    "Competitors", help="Number of registered competitors"
+                ),
+                "URL": st.column_config.LinkColumn("More Info"),
+                "Registered": st.column_config.CheckboxColumn("Registered"),
+            },
+            hide_index=True,
+            use_container_width=True,
+            key="events_table",
+            on_select="rerun" if selectable else "ignore",
+            selection_mode="single-row",
+        )
 
-                    if is_registered:
-                        if st.button("Unregister", key=f"unreg_{event_id}"):
-                            if unregister_from_event(conn, event_id, user_id):
-                                st.success("Successfully unregistered!")
-                                st.rerun()
-                    else:
-                        if st.button("Register", key=f"reg_{event_id}"):
-                            if register_for_event(conn, event_id, user_id):
-                                st.success("Successfully registered!")
-                                st.rerun()
+        if selectable:
+            selected_rows = event_list.selection.rows
+            if selected_rows:
+                row = events.iloc[selected_rows[0]]
+                event_id = row["Event ID"]
+
+                if row["Registered"]:
+                    if st.button(f"Unregister from {row['Event Name']}", key=f"unreg_{event_id}"):
+                        if unregister_from_event(conn, event_id, user_id):
+                            st.success("Successfully unregistered!")
+                            st.rerun(scope="fragment")
+                else:
+                    if st.button(f"Register for {row['Event Name']}", key=f"reg_{event_id}"):
+                        if register_for_event(conn, event_id, user_id):
+                            st.success("Successfully registered!")
+                            st.rerun(scope="fragment")
+            else:
+                st.caption("Select an event to register or unregister.")
+
+        if len(events) >= EVENT_LIST_LIMIT:
+            st.caption(
+                f"Showing the next {EVENT_LIST_LIMIT} events. Search or filter to find later ones."
+            )
     else:
         st.write("No upcoming events found.")
 
@@ -1431,31 +1889,14 @@ def display_registration_tab(conn):
         dob = st.date_input("Date of Birth*")
         division = st.selectbox(
             "Division*",
-            (
-                "Alaska",
-                "Central",
-                "Eastern",
-                "Far West",
-                "Foreign",
-                "Intermountain",
-                "Northern",
-                "Pacific Northwest",
-                "Rocky",
-            ),
+            DIVISIONS,
             index=None,
             placeholder="Select your division",
         )
         team = st.text_input("Team (optional)")
         discipline = st.multiselect(
             "Discipline*",
-            options=[
-                "Alpine",
-                "Combined Alpine",
-                "Downhill",
-                "Giant Slalom",
-                "Slalom",
-                "Super G",
-            ],
+            options=DISCIPLINES,
         )
 
         submit = st.form_submit_button("Register")
@@ -1498,18 +1939,28 @@ def display_login_tab(conn):
         login_submitted = st.form_submit_button("Login")
 
         if login_submitted:
-            success, user_name = verify_login(conn, login_email, login_password)
-            if success:
+            profile = login_and_fetch_profile(conn, login_email, login_password)
+            if profile:
                 st.session_state.logged_in = True
                 st.session_state.user_email = login_email
+                st.session_state.user_profile = profile
                 st.rerun()
             else:
                 st.error("Invalid email or password")
 
 
+def logout():
+    """Clear the logged-in user from the session"""
+    st.session_state.logged_in = False
+    st.session_state.user_email = None
+    st.session_state.user_profile = None
+    st.rerun()
+
+
+@pooled_fragment
 def display_profile_tab(conn):
-    user_info = get_user_info(conn, st.session_state.user_email)
-    user_id = get_user_id(conn, st.session_state.user_email)
+    user_info = st.session_state.user_profile
+    user_id = user_info["UID"] if user_info else None
 
     if user_info:
         col1, col2 = st.columns([3, 1])
@@ -1517,7 +1968,7 @@ def display_profile_tab(conn):
             st.header(f"Welcome, {user_info['Name']}!")
             st.subheader("Your Registration Details")
             for key, value in user_info.items():
-                if key != "Name":  # Skip name since we already showed it
+                if key not in ("Name", "UID"):  # Name is shown above, UID is internal
                     st.write(f"**{key}:** {value}")
         with col2:
             if st.button("Logout", type="primary"):
@@ -1548,9 +1999,10 @@ def display_profile_tab(conn):
         st.write("You haven't registered for any events yet.")
 
 
+@pooled_fragment
 def display_new_event_tab(conn):
     st.header("Create New Event")
-    user_id = get_user_id(conn, st.session_state.user_email)
+    user_id = st.session_state.user_profile["UID"]
 
     with st.form("create_event_form", clear_on_submit=True):
         event_name = st.text_input("Event Name*")
@@ -1562,28 +2014,11 @@ def display_new_event_tab(conn):
         venue = st.text_input("Venue*")
         discipline = st.selectbox(
             "Discipline*",
-            options=[
-                "Alpine",
-                "Combined Alpine",
-                "Downhill",
-                "Giant Slalom",
-                "Slalom",
-                "Super G",
-            ],
+            options=DISCIPLINES,
         )
         division = st.selectbox(
             "Division*",
-            options=[
-                "Alaska",
-                "Central",
-                "Eastern",
-                "Far West",
-                "Foreign",
-                "Intermountain",
-                "Northern",
-                "Pacific Northwest",
-                "Rocky",
-            ],
+            options=DIVISIONS,
             index=None,
             placeholder="Select division",
         )
@@ -1621,10 +2056,14 @@ def display_new_event_tab(conn):
 
                 if success:
                     st.success("Event created successfully!")
-                    st.rerun()
+                    st.rerun(scope="fragment")
             else:
                 st.error("Please fill in all required fields (marked with *)")
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # Hand the connection back to the pool, including on st.rerun()
+        conn.close()